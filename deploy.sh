@@ -89,6 +89,20 @@ echo "[2/2] Deploying function code..."
 echo "This may take 3-5 minutes for remote build..."
 cd function_app
 
+# Ship qscanner pre-extracted so workers don't unpack the bundled archive on cold start.
+# Re-extract when the archive is newer than a previous extraction (touch, since tar keeps
+# the archived mtime). The archive stays in the package as the runtime fallback in case
+# the deployment drops the binary's exec bit
+QSCANNER_ARCHIVE="qscanner-${QSCANNER_VERSION:-4.6.0-4}.linux-amd64.tar.gz"
+if [ -f "$QSCANNER_ARCHIVE" ] && { [ ! -x qscanner ] || [ "$QSCANNER_ARCHIVE" -nt qscanner ]; }; then
+  tar -xzf "$QSCANNER_ARCHIVE" qscanner && chmod +x qscanner && touch qscanner
+fi
+# Without an archive for this version, never ship a binary left over from another one
+sed -i.bak '/^qscanner$/d' .funcignore && rm -f .funcignore.bak
+if [ ! -f "$QSCANNER_ARCHIVE" ]; then
+  echo qscanner >> .funcignore
+fi
+
 if func azure functionapp publish "$FUNCTION_APP" --python --build remote 2>&1; then
   echo "Function code deployed successfully"
 else
@@ -1,257 +1,646 @@
 import os
-import json
+import re
 import logging
+import functools
+import threading
+import concurrent.futures
 import azure.functions as func
-from datetime import datetime
+from azure.core.rest import HttpRequest
+from azure.identity import DefaultAzureCredential
+from datetime import datetime, timezone
+from typing import List, NamedTuple, Optional
 
 # Import helper modules
+import json_codec
 from qualys_scanner_binary import QScannerBinary
-from image_parser import ImageParser
-from storage_handler import StorageHandler
+from image_parser import ImageParser, ImageInfo
+from storage_handler import StorageHandler, ScanRecord, QUERY_CONCURRENCY
 
 app = func.FunctionApp()
 
+# App settings are fixed for the lifetime of the worker process, so read them once
+STORAGE_CONNECTION_STRING = os.environ.get('STORAGE_CONNECTION_STRING')
+SCAN_CONCURRENCY = max(1, int(os.environ.get('SCAN_CONCURRENCY', '4')))
+RECORD_CONCURRENCY = max(1, int(os.environ.get('RECORD_CONCURRENCY', '4')))
+BACKGROUND_CONCURRENCY = 2
+BACKGROUND_WAIT_SECONDS = 5
+
+# Activity Log operations that create or update a scannable container, by container type
+# (keys lower-case; diagnostic settings export operation names in varying case)
+_CONTAINER_WRITE_OPERATIONS = {
+    'microsoft.containerinstance/containergroups/write': 'ACI',
+    'microsoft.app/containerapps/write': 'ACA',
+}
+# Successful resultType / status values, lower-case
+_SUCCESS_RESULTS = frozenset({'success', 'succeeded'})
+# Name prefix of the scanner's own containers, which must never be scanned
+_SCANNER_PREFIX = 'qscanner-'
+# Cheap pre-filter on raw Event Hub payloads, applied before JSON parsing
+_CONTAINER_WRITE_RE = re.compile(rb'containergroups/write|containerapps/write', re.IGNORECASE)
+
+# ARM batch endpoint for resolving several containers in one management round-trip
+ARM_ENDPOINT = 'https://management.azure.com'
+ARM_BATCH_API_VERSION = '2020-06-01'
+ARM_BATCH_SIZE = 20
+ARM_API_VERSIONS = {'ACI': '2023-05-01', 'ACA': '2023-05-01'}
+
+# Long-lived clients, reused across invocations while the worker stays warm
+_credential = None
+_transport = None
+_aci_clients = {}
+_aca_clients = {}
+_storage = None
+_scanners = {}
+# Worker-wide scan pool: caps concurrent qscanner runs across all records and
+# keeps its threads alive between invocations
+_scan_executor = concurrent.futures.ThreadPoolExecutor(max_workers=SCAN_CONCURRENCY, thread_name_prefix='scan')
+# Off-critical-path writes (error records, marker cleanup) run here so scan workers move on
+_background_executor = concurrent.futures.ThreadPoolExecutor(max_workers=BACKGROUND_CONCURRENCY,
+                                                           thread_name_prefix='post')
+_background_futures = set()
+_background_lock = threading.Lock()
+# Guards the per-batch set of images already claimed by a container
+_seen_lock = threading.Lock()
+# Records are processed on several threads; build each client exactly once
+_client_lock = threading.RLock()
+
+
+def submit_background(fn, *args):
+    """Run fn(*args) on the background executor; activity_log_processor waits for it before returning"""
+    future = _background_executor.submit(fn, *args)
+    with _background_lock:
+        _background_futures.add(future)
+    future.add_done_callback(_discard_background)
+
+
+def _discard_background(future):
+    """Forget a finished background future"""
+    with _background_lock:
+        _background_futures.discard(future)
+
+
+def wait_for_background(timeout: float):
+    """Wait up to timeout seconds for pending background work"""
+    with _background_lock:
+        pending = list(_background_futures)
+    if pending:
+        _, not_done = concurrent.futures.wait(pending, timeout=timeout)
+        if not_done:
+            logging.warning('%d background tasks still running after %ss', len(not_done), timeout)
+
+
+def get_credential():
+    """Return the shared managed identity credential (token cache survives across events)"""
+    global _credential
+    if _credential is None:
+        with _client_lock:
+            if _credential is None:
+                _credential = DefaultAzureCredential()
+    return _credential
+
+
+def get_transport():
+    """Return the HTTP transport shared by the management and storage clients (one connection pool)"""
+    global _transport
+    if _transport is None:
+        with _client_lock:
+            if _transport is None:
+                import requests
+                from azure.core.pipeline.transport import RequestsTransport
+
+                # Every executor sharing this session can hold a connection at once: record
+                # workers, scan workers, the storage handler's table query pool and the
+                # background writers. Retries stay with the SDK pipeline policies
+                session = requests.Session()
+                pool_size = SCAN_CONCURRENCY + RECORD_CONCURRENCY + QUERY_CONCURRENCY + BACKGROUND_CONCURRENCY
+                session.mount('https://', requests.adapters.HTTPAdapter(pool_connections=10, pool_maxsize=pool_size))
+                _transport = RequestsTransport(session=session, session_owner=False)
+    return _transport
+
+
+def get_aci_client(subscription_id: str):
+    """Return the ACI management client for a subscription, creating it on first use"""
+    client = _aci_clients.get(subscription_id)
+    if client is None:
+        with _client_lock:
+            client = _aci_clients.get(subscription_id)
+            if client is None:
+                # Imported here so workers that only see ACA events never load the ACI SDK
+                from azure.mgmt.containerinstance import ContainerInstanceManagementClient
+
+                logging.info('API FETCH: Creating ACI management client')
+                client = _aci_clients[subscription_id] = ContainerInstanceManagementClient(
+                    get_credential(), subscription_id, transport=get_transport())
+    return client
+
+
+def get_aca_client(subscription_id: str):
+    """Return the ACA management client for a subscription, creating it on first use"""
+    client = _aca_clients.get(subscription_id)
+    if client is None:
+        with _client_lock:
+            client = _aca_clients.get(subscription_id)
+            if client is None:
+                # Imported here so workers that only see ACI events never load the ACA SDK
+                from azure.mgmt.appcontainers import ContainerAppsAPIClient
+
+                logging.info('API FETCH: Creating ACA management client')
+                client = _aca_clients[subscription_id] = ContainerAppsAPIClient(
+                    get_credential(), subscription_id, transport=get_transport())
+    return client
+
+
+def get_management_client(container_type: str, subscription_id: str):
+    """Return the cached management client for a container type ('ACI' or 'ACA') and subscription"""
+    if container_type == 'ACI':
+        return get_aci_client(subscription_id)
+    return get_aca_client(subscription_id)
+
+
+def get_storage() -> StorageHandler:
+    """Return the shared storage handler"""
+    global _storage
+    storage = _storage
+    if storage is None:
+        if not STORAGE_CONNECTION_STRING:
+            raise RuntimeError('STORAGE_CONNECTION_STRING app setting is not configured')
+        # Construction creates the blob container and table over the network, so keep
+        # it outside _client_lock and publish under it
+        storage = StorageHandler(connection_string=STORAGE_CONNECTION_STRING,
+                                 transport=get_transport())
+        with _client_lock:
+            if _storage is None:
+                _storage = storage
+            storage = _storage
+    return storage
+
+
+def get_scanner(subscription_id: str) -> QScannerBinary:
+    """Return the scanner for a subscription, creating it on first use"""
+    scanner = _scanners.get(subscription_id)
+    if scanner is None:
+        # Construction may extract or download the qscanner binary (serialized by
+        # QScannerBinary itself), so keep it outside _client_lock and publish under it
+        scanner = QScannerBinary(subscription_id=subscription_id)
+        with _client_lock:
+            scanner = _scanners.setdefault(subscription_id, scanner)
+    return scanner
+
+
+def collect_images(containers) -> list:
+    """Collect images from (name, image) pairs of ACI or ACA containers"""
+    images = []
+    for name, image in containers:
+        if image:
+            logging.info('  Container: name=%s, image=%s', name, image)
+            images.append(image)
+        else:
+            logging.warning('  Container: name=%s has no image', name)
+    return images
+
 
 def fetch_container_images(subscription_id: str, resource_group: str, container_name: str, container_type: str) -> list:
     """Fetch container images from Azure management API"""
     images = []
+    containers = None
 
     try:
-        logging.info(f'API FETCH: Importing Azure SDK libraries')
-        from azure.identity import DefaultAzureCredential
-        from azure.mgmt.containerinstance import ContainerInstanceManagementClient
-
-        logging.info(f'API FETCH: Authenticating with Azure using managed identity')
-        logging.info(f'  Target: {container_type} container {container_name} in {resource_group}')
-        logging.info(f'  Subscription: {subscription_id}')
-
-        credential = DefaultAzureCredential()
+        logging.info('API FETCH: Authenticating with Azure using managed identity')
+        logging.info('  Target: %s container %s in %s', container_type, container_name, resource_group)
+        logging.info('  Subscription: %s', subscription_id)
 
         if container_type == 'ACI':
-            logging.info(f'API FETCH: Creating ACI management client')
-            aci_client = ContainerInstanceManagementClient(credential, subscription_id)
+            aci_client = get_aci_client(subscription_id)
 
-            logging.info(f'API FETCH: Calling container_groups.get()')
+            logging.info('API FETCH: Calling container_groups.get()')
             container_group = aci_client.container_groups.get(resource_group, container_name)
 
-            logging.info(f'API FETCH SUCCESS: Retrieved container group {container_group.name}')
-            logging.info(f'  Provisioning State: {container_group.provisioning_state}')
-            logging.info(f'  Number of containers: {len(container_group.containers)}')
+            logging.info('API FETCH SUCCESS: Retrieved container group %s', container_group.name)
+            logging.info('  Provisioning State: %s', container_group.provisioning_state)
 
-            for idx, container in enumerate(container_group.containers):
-                if container.image:
-                    logging.info(f'  Container {idx + 1}: name={container.name}, image={container.image}')
-                    images.append(container.image)
-                else:
-                    logging.warning(f'  Container {idx + 1}: name={container.name} has no image')
+            containers = container_group.containers
 
         elif container_type == 'ACA':
-            logging.info(f'API FETCH: Creating ACA management client')
-            from azure.mgmt.appcontainers import ContainerAppsAPIClient
-
-            aca_client = ContainerAppsAPIClient(credential, subscription_id)
+            aca_client = get_aca_client(subscription_id)
 
-            logging.info(f'API FETCH: Calling container_apps.get()')
+            logging.info('API FETCH: Calling container_apps.get()')
             container_app = aca_client.container_apps.get(resource_group, container_name)
 
-            logging.info(f'API FETCH SUCCESS: Retrieved container app {container_app.name}')
-            logging.info(f'  Provisioning State: {container_app.provisioning_state}')
+            logging.info('API FETCH SUCCESS: Retrieved container app %s', container_app.name)
+            logging.info('  Provisioning State: %s', container_app.provisioning_state)
 
             # Extract images from container app template
-            if container_app.template and container_app.template.containers:
-                logging.info(f'  Number of containers: {len(container_app.template.containers)}')
-                for idx, container in enumerate(container_app.template.containers):
-                    if container.image:
-                        logging.info(f'  Container {idx + 1}: name={container.name}, image={container.image}')
-                        images.append(container.image)
-                    else:
-                        logging.warning(f'  Container {idx + 1}: name={container.name} has no image')
-            else:
-                logging.warning('  No containers found in template')
+            containers = container_app.template.containers if container_app.template else None
 
-    except Exception as e:
-        logging.error(f'API FETCH ERROR: Failed to retrieve container images from Azure')
-        logging.error(f'  Error type: {type(e).__name__}')
-        logging.error(f'  Error message: {str(e)}')
-        import traceback
-        logging.error(f'  Traceback: {traceback.format_exc()}')
-
-    return images
-
-
-def extract_resource_group(subject: str) -> str:
-    """Extract resource group name from Azure resource URI (case-insensitive)"""
-    try:
-        parts = subject.split('/')
-        parts_lower = [p.lower() for p in parts]
-        rg_index = parts_lower.index('resourcegroups') + 1
-        return parts[rg_index]
-    except Exception as e:
-        logging.error(f'Failed to extract resource group from subject: {subject}, error: {e}')
-        return 'unknown'
+        if containers:
+            logging.info('  Number of containers: %d', len(containers))
+            images = collect_images((container.name, container.image) for container in containers)
+        else:
+            logging.warning('  No containers found')
 
+    except Exception:
+        logging.exception('API FETCH ERROR: Failed to retrieve container images from Azure')
 
-def process_activity_log_record(record: dict):
-    """Process a single Activity Log record from diagnostic settings"""
-    try:
-        # Extract event details from diagnostic settings format
-        operation_name = record.get('operationName', {})
-        if isinstance(operation_name, dict):
-            operation_name = operation_name.get('value', '')
+    return images
 
-        result_type = record.get('resultType', '') or record.get('status', {}).get('value', '')
-        resource_id = record.get('resourceId', '')
 
-        logging.info(f'Record: operation={operation_name}, result={result_type}, resource={resource_id}')
+def _images_from_resource(container_type: str, resource: dict) -> list:
+    """Collect images from a raw ACI container group or ACA container app resource body"""
+    properties = resource.get('properties') or {}
+    if container_type == 'ACI':
+        return collect_images(
+            (c.get('name'), (c.get('properties') or {}).get('image'))
+            for c in properties.get('containers') or ())
+    template = properties.get('template') or {}
+    return collect_images((c.get('name'), c.get('image')) for c in template.get('containers') or ())
 
-        # Check if this is a successful container creation event (ACI or ACA)
-        is_aci = 'CONTAINERINSTANCE/CONTAINERGROUPS/WRITE' in operation_name.upper()
-        is_aca = 'APP/CONTAINERAPPS/WRITE' in operation_name.upper()
 
-        if (is_aci or is_aca) and result_type.upper() in ['SUCCESS', 'SUCCEEDED']:
-            container_type = 'ACI' if is_aci else 'ACA'
-            logging.info(f'EVENT MATCHED: {container_type} container creation detected')
+def fetch_container_images_batch(targets: List['ContainerTarget']) -> dict:
+    """Fetch images for several containers through the ARM batch endpoint
 
-            # Parse resource ID to extract subscription, resource group, and container name
-            resource_parts = resource_id.split('/')
-            subscription_id = resource_parts[2] if len(resource_parts) > 2 else None
+    Returns a dict of resource ID to image list. Containers whose lookup failed are
+    left out so the caller falls back to fetch_container_images for them.
+    """
+    images_by_resource = {}
+    try:
+        # Any management client carries an authenticated ARM pipeline; the batch
+        # endpoint itself is not tied to a subscription or resource provider, so reuse
+        # one that this batch needs anyway rather than loading the other SDK
+        client = get_management_client(targets[0].container_type, targets[0].subscription_id)
+
+        for start in range(0, len(targets), ARM_BATCH_SIZE):
+            chunk = targets[start:start + ARM_BATCH_SIZE]
+            # Each request is named so its response can be matched regardless of order
+            body = {'requests': [
+                {
+                    'name': str(index),
+                    'httpMethod': 'GET',
+                    'url': f'{ARM_ENDPOINT}{t.resource_id}?api-version={ARM_API_VERSIONS[t.container_type]}',
+                }
+                for index, t in enumerate(chunk)
+            ]}
+
+            logging.info('API FETCH: Batch request for %d containers', len(chunk))
+            request = HttpRequest('POST', f'{ARM_ENDPOINT}/batch?api-version={ARM_BATCH_API_VERSION}',
+                                  content=json_codec.dumps(body),
+                                  headers={'Content-Type': 'application/json'})
+            response = client._send_request(request)
+            response.raise_for_status()
+
+            responses = {item.get('name'): item
+                         for item in json_codec.loads(response.content).get('responses') or ()}
+            for index, target in enumerate(chunk):
+                item = responses.get(str(index))
+                if item is None:
+                    logging.warning('API FETCH: No batch response for %s', target.resource_id)
+                    continue
+                # Each slot carries its own status; a 404 or 429 body is not a container resource
+                if item.get('httpStatusCode') != 200:
+                    logging.warning('API FETCH: Batch lookup failed for %s (HTTP %s)',
+                                    target.resource_id, item.get('httpStatusCode'))
+                    continue
+                logging.info('API FETCH SUCCESS: Retrieved %s %s', target.container_type, target.container_name)
+                images_by_resource[target.resource_id] = _images_from_resource(
+                    target.container_type, item.get('content') or {})
+
+    except Exception:
+        logging.exception('API FETCH ERROR: Batch request failed, falling back to per-container lookups')
+
+    return images_by_resource
+
+
+def parse_resource_id(resource_id: str) -> Optional[tuple]:
+    """Split an Azure resource ID into (subscription_id, resource_group, name) by fixed segment position"""
+    # /subscriptions/{sub}/resourceGroups/{rg}/providers/{namespace}/{type}/{name}
+    parts = resource_id.split('/', 9)
+    if (len(parts) != 9 or parts[0]
+            or parts[1].lower() != 'subscriptions'
+            or parts[3].lower() != 'resourcegroups'
+            or parts[5].lower() != 'providers'
+            or not all(parts[2:])):
+        return None
+    return parts[2], parts[4], parts[8]
+
+
+def scan_container_image(image_info: ImageInfo, scanner: QScannerBinary, storage: StorageHandler,
+                         resource_id: str, container_type: str, custom_tags: dict,
+                         timestamp: str, errors: list) -> Optional[ScanRecord]:
+    """Scan a single parsed container image, returning the result record to persist
+
+    Failures are appended to errors so the caller can persist them in one flush.
+    """
+    image = image_info.full_name
+    logging.info('SCANNING IMAGE: %s', image)
+    submitted = False
 
-            try:
-                resource_group_idx = [p.lower() for p in resource_parts].index('resourcegroups') + 1
-                resource_group = resource_parts[resource_group_idx]
-            except (ValueError, IndexError):
-                logging.error(f'Failed to extract resource group from resource ID: {resource_id}')
-                return
+    try:
+        scan_handle = scanner.submit_scan(
+            registry=image_info.registry,
+            repository=image_info.repository,
+            tag=image_info.tag,
+            digest=image_info.digest,
+            custom_tags=custom_tags
+        )
+
+        # Record the submission right away so other invocations skip this image while it scans
+        storage.mark_scan_submitted(image, container_type, timestamp)
+        submitted = True
+
+        scan_result = scanner.wait_for_scan(scan_handle)
+
+        logging.info('  SCAN COMPLETED: image=%s, scan_id=%s', image, scan_result.get('scan_id'))
+        logging.info('  Status: %s', scan_result.get('status'))
+
+        vulnerabilities = scan_result.get('vulnerabilities', {})
+        logging.info('  Vulnerabilities: Critical=%s, High=%s',
+                     vulnerabilities.get('CRITICAL', 0), vulnerabilities.get('HIGH', 0))
+
+        return ScanRecord(
+            timestamp,
+            container_type,
+            image,
+            resource_id,
+            scan_result.get('scan_id'),
+            scan_result.get('status'),
+            vulnerabilities,
+            scan_result.get('compliance', {})
+        )
+
+    except Exception as img_error:
+        logging.exception('SCAN ERROR: Failed to process image %s', image)
+        if submitted:
+            submit_background(storage.clear_scan_submitted, image)
+        errors.append({
+            'timestamp': timestamp,
+            'image': image,
+            'error': str(img_error),
+            'resource_id': resource_id
+        })
+        return None
+
+
+@functools.lru_cache(maxsize=1024)
+def classify_operation(operation_name: str) -> Optional[str]:
+    """Return 'ACI' or 'ACA' for container write operations, else None (memoized per operation name)
+
+    Activity Log traffic repeats a small set of operation names, so each spelling is
+    case-folded once per worker instead of once per record.
+    """
+    return _CONTAINER_WRITE_OPERATIONS.get(operation_name.lower())
+
+
+class ContainerTarget(NamedTuple):
+    """Container created by a successful ACI/ACA Activity Log record"""
+    container_type: str
+    subscription_id: str
+    resource_group: str
+    container_name: str
+    resource_id: str
+
+
+def match_container_record(record: dict) -> Optional[ContainerTarget]:
+    """Return the container created by an Activity Log record, or None if it is not a scan target"""
+    # Extract event details from diagnostic settings format
+    # Diagnostic settings always nest {"value": ...}; an exact class check is cheaper than isinstance
+    operation_name = record.get('operationName') or ''
+    if isinstance(operation_name, dict):
+        operation_name = operation_name.get('value') or ''
+
+    # Most records in a batch are unrelated to containers; drop them on the operation alone
+    container_type = classify_operation(operation_name)
+    if container_type is None:
+        return None
+
+    resource_id = record.get('resourceId', '')
+
+    # Skip qscanner containers to prevent infinite loops. They are the pipeline's own
+    # deployments, so check them before anything else; the names are created lower-case,
+    # and only other spellings need the bounded case-folded slice
+    name_start = resource_id.rfind('/') + 1
+    if (resource_id.startswith(_SCANNER_PREFIX, name_start)
+            or resource_id[name_start:name_start + len(_SCANNER_PREFIX)].lower() == _SCANNER_PREFIX):
+        logging.info('SKIPPED: qscanner container (prevents infinite loop)')
+        return None
+
+    result_type = record.get('resultType')
+    if not result_type:
+        status = record.get('status')
+        result_type = (status.get('value') if isinstance(status, dict) else status) or ''
+
+    logging.debug('Record: operation=%s, result=%s, resource=%s', operation_name, result_type, resource_id)
+
+    # Only successful creations are scanned (ACI or ACA)
+    if result_type.lower() not in _SUCCESS_RESULTS:
+        logging.debug('EVENT SKIPPED: Not a successful container creation event')
+        return None
+
+    logging.info('EVENT MATCHED: %s container creation detected', container_type)
+
+    # Parse resource ID to extract subscription, resource group, and container name
+    parsed = parse_resource_id(resource_id)
+    if parsed is None:
+        logging.error('Failed to parse resource ID: %s', resource_id)
+        return None
+
+    subscription_id, resource_group, container_name = parsed
+
+    logging.info('Subscription: %s', subscription_id)
+    logging.info('Resource Group: %s', resource_group)
+    logging.info('Container Name: %s', container_name)
+
+    return ContainerTarget(container_type, subscription_id, resource_group, container_name, resource_id)
+
+
+def process_container(target: ContainerTarget, timestamp: str, images: Optional[list] = None,
+                      seen: Optional[set] = None, recent: Optional[set] = None):
+    """Scan the images of a newly created container, fetching them from Azure unless already known
+
+    timestamp is the batch's record timestamp, stamped on every result. seen is shared
+    by the containers of one Event Hub batch; images another container already claimed
+    are left to it. recent, when given, is the batch-wide result of the recent-scan
+    lookup covering all of images, so no per-container query is needed.
+    """
+    try:
+        container_type = target.container_type
+        resource_id = target.resource_id
 
-            container_name = resource_parts[-1]
+        if images is None:
+            # Fetch container details from Azure
+            logging.info('FETCHING: Container details from Azure Management API')
+            images = fetch_container_images(target.subscription_id, target.resource_group,
+                                            target.container_name, container_type)
 
-            logging.info(f'Subscription: {subscription_id}')
-            logging.info(f'Resource Group: {resource_group}')
-            logging.info(f'Container Name: {container_name}')
+        if not images:
+            logging.warning('NO IMAGES: No container images found for %s', target.container_name)
+            return
 
-            # Skip qscanner containers to prevent infinite loops
-            if container_name.startswith('qscanner-'):
-                logging.info(f'SKIPPED: qscanner container (prevents infinite loop)')
+        logging.info('FOUND: %d container images to scan in %s', len(images), target.container_name)
+        if logging.getLogger().isEnabledFor(logging.INFO):
+            for img in images:
+                logging.info('  Image: %s', img)
+
+        # Reuse scanner and storage across invocations
+        # Using remote registry scanning (Option 3) - no container runtime needed!
+        scanner = get_scanner(target.subscription_id)
+        storage = get_storage()
+
+        # Parse images, collapsing duplicates (sidecars, replicas, "nginx" vs
+        # "docker.io/library/nginx:latest") so each unique image is scanned once
+        image_infos = {}
+        for image in dict.fromkeys(images):
+            image_info = ImageParser.parse(image)
+            if image_info.full_name in image_infos:
+                logging.info('  DUPLICATE: %s resolves to %s', image, image_info.full_name)
+                continue
+            logging.info('  Parsed: registry=%s, repo=%s, tag=%s',
+                         image_info.registry, image_info.repository, image_info.tag)
+            image_infos[image_info.full_name] = image_info
+
+        if seen is not None:
+            with _seen_lock:
+                claimed = seen.intersection(image_infos)
+                seen.update(image_infos)
+            for full_name in claimed:
+                logging.info('  DUPLICATE IN BATCH: %s is handled by another container', full_name)
+                del image_infos[full_name]
+            if not image_infos:
+                logging.info('PROCESSING COMPLETE: All images handled elsewhere in this batch')
                 return
 
-            # Fetch container details from Azure
-            logging.info('FETCHING: Container details from Azure Management API')
-            images = fetch_container_images(subscription_id, resource_group, container_name, container_type)
+        # One storage query for the whole container (or batch) instead of one per image
+        if recent is None:
+            recent = storage.get_recently_scanned(list(image_infos))
+        pending = []
+        for info in image_infos.values():
+            if info.full_name in recent:
+                logging.info('  CACHED: Image recently scanned: %s', info.full_name)
+            else:
+                pending.append(info)
 
-            if not images:
-                logging.warning('NO IMAGES: No container images found')
-                return
+        if not pending:
+            logging.info('PROCESSING COMPLETE: All images recently scanned')
+            return
 
-            logging.info(f'FOUND: {len(images)} container images to scan')
-            for idx, img in enumerate(images):
-                logging.info(f'  Image {idx + 1}: {img}')
-
-            # Initialize scanner and storage
-            # Using remote registry scanning (Option 3) - no container runtime needed!
-            scanner = QScannerBinary(subscription_id=subscription_id)
-            storage = StorageHandler(connection_string=os.environ['STORAGE_CONNECTION_STRING'])
-
-            # Scan each image
-            results = []
-            for idx, image in enumerate(images):
-                logging.info(f'SCANNING IMAGE {idx + 1}/{len(images)}: {image}')
-
-                try:
-                    image_info = ImageParser.parse(image)
-                    logging.info(f'  Parsed: registry={image_info.get("registry")}, repo={image_info.get("repository")}, tag={image_info.get("tag")}')
-
-                    if storage.is_recently_scanned(image_info['full_name']):
-                        logging.info(f'  CACHED: Image recently scanned')
-                        continue
-
-                    # Custom tags for tracking
-                    custom_tags = {
-                        'azure_resource_id': resource_id,
-                        'container_type': container_type,
-                        'scan_method': 'remote_registry'
-                    }
-
-                    scan_result = scanner.scan_image(
-                        registry=image_info['registry'],
-                        repository=image_info['repository'],
-                        tag=image_info['tag'],
-                        digest=image_info.get('digest'),
-                        custom_tags=custom_tags
-                    )
-
-                    logging.info(f'  SCAN COMPLETED: scan_id={scan_result.get("scan_id")}')
-                    logging.info(f'  Status: {scan_result.get("status")}')
-
-                    vulnerabilities = scan_result.get('vulnerabilities', {})
-                    logging.info(f'  Vulnerabilities: Critical={vulnerabilities.get("CRITICAL", 0)}, High={vulnerabilities.get("HIGH", 0)}')
-
-                    result_record = {
-                        'timestamp': datetime.utcnow().isoformat(),
-                        'container_type': container_type,
-                        'image': image,
-                        'resource_id': resource_id,
-                        'scan_id': scan_result.get('scan_id'),
-                        'status': scan_result.get('status'),
-                        'vulnerabilities': vulnerabilities,
-                        'scan_method': 'remote_registry'
-                    }
-
-                    storage.save_scan_result(result_record)
-                    results.append(result_record)
-                    logging.info(f'  SAVED: Scan submission recorded')
-
-                except Exception as img_error:
-                    logging.error(f'SCAN ERROR: Failed to process image {image}')
-                    logging.error(f'  Error: {str(img_error)}')
-                    import traceback
-                    logging.error(f'  Traceback: {traceback.format_exc()}')
-                    storage.save_error({
-                        'timestamp': datetime.utcnow().isoformat(),
-                        'image': image,
-                        'error': str(img_error),
-                        'resource_id': resource_id
-                    })
-
-            logging.info(f'PROCESSING COMPLETE: Successfully processed {len(results)} images')
-        else:
-            logging.debug(f'EVENT SKIPPED: Not a container creation event')
+        # Custom tags for tracking and the record timestamp are the same for every image
+        custom_tags = {
+            'azure_resource_id': resource_id,
+            'container_type': container_type,
+            'scan_method': 'remote_registry'
+        }
+        errors = []
+
+        # Scan images concurrently - each scan is dominated by qscanner/registry I/O
+        scan = functools.partial(scan_container_image, scanner=scanner, storage=storage,
+                                 resource_id=resource_id, container_type=container_type,
+                                 custom_tags=custom_tags, timestamp=timestamp, errors=errors)
+        results = [result for result in _scan_executor.map(scan, pending) if result]
+
+        # Persist all results with one flush instead of one storage round-trip per image;
+        # per-image errors are recorded even if that flush fails
+        try:
+            if results:
+                storage.save_scan_results(results)
+                logging.info('SAVED: %d scan results recorded', len(results))
+                # The results now answer recent-scan lookups; drop their in-flight markers
+                submit_background(storage.clear_scan_markers, [result.image for result in results])
+        finally:
+            if errors:
+                submit_background(storage.save_errors, errors)
+
+        logging.info('PROCESSING COMPLETE: Successfully processed %d images', len(results))
+
+    except Exception:
+        logging.exception('ERROR processing container %s', target.resource_id)
+
+
+def iter_activity_log_records(events: List[func.EventHubEvent]):
+    """Yield Activity Log records from a batch of events, one payload at a time"""
+    for index, event in enumerate(events):
+        event_body = event.get_body()
+
+        # Most Activity Log events are unrelated to containers; skip them without parsing
+        if not _CONTAINER_WRITE_RE.search(event_body):
+            continue
+
+        # Parse the raw bytes directly (orjson when available), no intermediate decoded str.
+        # One malformed event must not sink the valid records batched with it
+        try:
+            payload = json_codec.loads(event_body)
+        except ValueError as e:
+            logging.warning('Skipping event %d: body is not valid JSON (%s)', index, e)
+            continue
 
-    except Exception as e:
-        logging.error(f'ERROR processing activity log record: {str(e)}')
-        import traceback
-        logging.error(f'Traceback: {traceback.format_exc()}')
+        # Activity Log events from diagnostic settings come wrapped in a 'records' array
+        records = payload.get('records') if isinstance(payload, dict) else None
+        if not isinstance(records, list):
+            logging.warning('Skipping event %d: no Activity Log records array', index)
+            continue
+        yield from records
 
 
 @app.function_name(name="ActivityLogProcessor")
 @app.event_hub_message_trigger(
-    arg_name="event",
+    arg_name="events",
     event_hub_name="activity-log",
     connection="EVENTHUB_CONNECTION_STRING",
-    cardinality=func.Cardinality.ONE
+    cardinality=func.Cardinality.MANY
 )
-def activity_log_processor(event: func.EventHubEvent):
-    """Process Activity Log events from Event Hub for container deployments"""
-    logging.info('ACTIVITY LOG EVENT: Function triggered')
+def activity_log_processor(events: List[func.EventHubEvent]):
+    """Process batches of Activity Log events from Event Hub for container deployments"""
+    logging.info('ACTIVITY LOG EVENT: Function triggered with %d events', len(events))
 
     try:
-        event_body = event.get_body().decode('utf-8')
-        event_data = json.loads(event_body)
-
-        # Activity Log events from diagnostic settings come wrapped in a 'records' array
-        records = event_data.get('records', [])
-        if not records:
-            logging.warning('No records found in event')
+        # Keyed by resource ID: one deployment can log several write records for the same container
+        targets = {}
+        record_count = 0
+        for record in iter_activity_log_records(events):
+            record_count += 1
+            try:
+                target = match_container_record(record)
+            except Exception:
+                logging.exception('ERROR processing activity log record')
+                continue
+            if target is None:
+                continue
+            key = target.resource_id.lower()
+            if key in targets:
+                logging.info('DUPLICATE: %s already queued in this batch', target.resource_id)
+                continue
+            targets[key] = target
+        targets = list(targets.values())
+        logging.info('Processed %d Activity Log records', record_count)
+
+        if not targets:
+            logging.info('No container deployment records found in event batch')
             return
 
-        logging.info(f'Processing {len(records)} Activity Log records')
+        # Several containers in one batch: resolve their images with ARM batch requests
+        images_by_resource = fetch_container_images_batch(targets) if len(targets) > 1 else {}
+
+        # Images already known for the batch: one recent-scan lookup covers all of them
+        recent_in_batch = None
+        if images_by_resource:
+            full_names = {ImageParser.normalize_image_name(image)
+                          for images in images_by_resource.values() for image in images}
+            recent_in_batch = get_storage().get_recently_scanned(list(full_names))
+
+        # Process containers concurrently so remaining lookups and scans overlap; an image
+        # shared by several containers in the batch is checked and scanned only once
+        seen = set()
+        # One record timestamp for the whole batch
+        timestamp = datetime.now(timezone.utc).isoformat()
+
+        def process(target: ContainerTarget):
+            images = images_by_resource.get(target.resource_id)
+            process_container(target, timestamp, images, seen, recent_in_batch if images is not None else None)
+
+        max_workers = min(RECORD_CONCURRENCY, len(targets))
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            list(executor.map(process, targets))
 
-        # Process each record in the batch
-        for record in records:
-            process_activity_log_record(record)
+        # Error records and marker cleanup were handed off; give them a bounded window to land
+        wait_for_background(BACKGROUND_WAIT_SECONDS)
 
-    except Exception as e:
-        logging.error(f'CRITICAL ERROR: Activity log processing failed')
-        logging.error(f'  Error: {str(e)}')
-        import traceback
-        logging.error(f'  Traceback: {traceback.format_exc()}')
+    except Exception:
+        logging.exception('CRITICAL ERROR: Activity log processing failed')
         raise
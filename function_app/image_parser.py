@@ -2,7 +2,31 @@
 Container image name parser
 Handles various image name formats from different registries
 """
-from typing import Dict
+import functools
+import re
+from typing import NamedTuple, Optional
+
+# One pass over an image reference:
+#   [registry/]repository[:tag][@sha256:digest]
+# The first path component is a registry when more components follow it, or when it
+# looks like a host (contains '.' or ':'); a tag never contains '/', so "host:5000/app"
+# keeps its port
+_IMAGE_RE = re.compile(
+    r'^(?:(?P<registry>[^/]+)/(?=[^@]*/)|(?P<host>[^/]*[.:][^/]*)/)?'
+    r'(?P<repository>.*?)'
+    r'(?::(?P<tag>[^:/@]+))?'
+    r'(?:@sha256:(?P<digest>.+))?$',
+    re.DOTALL)
+
+
+class ImageInfo(NamedTuple):
+    """Parsed components of a container image name"""
+    registry: str
+    repository: str
+    tag: str
+    digest: Optional[str]
+    full_name: str
+    original: str
 
 
 class ImageParser:
@@ -12,7 +36,8 @@ class ImageParser:
     """
 
     @staticmethod
-    def parse(image_name: str) -> Dict:
+    @functools.lru_cache(maxsize=4096)
+    def parse(image_name: str) -> ImageInfo:
         """
         Parse a container image name into components
 
@@ -20,7 +45,7 @@ class ImageParser:
             image_name: Full image name (e.g., docker.io/library/nginx:latest)
 
         Returns:
-            Dictionary with parsed components:
+            ImageInfo with parsed components (memoized per worker process):
                 - registry: Registry hostname
                 - repository: Repository path
                 - tag: Image tag
@@ -33,49 +58,43 @@ class ImageParser:
             mcr.microsoft.com/dotnet/runtime:6.0 -> mcr.microsoft.com/dotnet/runtime:6.0
             nginx@sha256:abc123 -> docker.io/library/nginx@sha256:abc123
         """
-        # Handle digest format (image@sha256:...)
-        digest = None
-        if '@sha256:' in image_name:
-            image_name, digest = image_name.split('@sha256:')
-            digest = f'sha256:{digest}'
-
-        # Split tag from image name
-        tag = 'latest'
-        if ':' in image_name:
-            image_name, tag = image_name.rsplit(':', 1)
+        match = _IMAGE_RE.match(image_name)
+        registry, repository, tag, digest = match.group('registry', 'repository', 'tag', 'digest')
+        registry = registry or match.group('host')
 
-        # Parse registry and repository
-        parts = image_name.split('/')
-
-        if len(parts) == 1:
-            # Simple name like "nginx"
+        if registry is None:
+            # Docker Hub: "nginx" -> library/nginx, "user/repo" stays as is
             registry = 'docker.io'
-            repository = f'library/{parts[0]}'
-        elif len(parts) == 2:
-            # Could be "user/repo" or "registry/repo"
-            if '.' in parts[0] or ':' in parts[0]:
-                # Has registry (contains . or port)
-                registry = parts[0]
-                repository = parts[1]
-            else:
-                # Docker Hub user repository
-                registry = 'docker.io'
-                repository = f'{parts[0]}/{parts[1]}'
-        else:
-            # Full path with registry
-            registry = parts[0]
-            repository = '/'.join(parts[1:])
+            if '/' not in repository:
+                repository = f'library/{repository}'
 
-        # Construct full name
-        full_name = f'{registry}/{repository}:{tag}'
+        tag = tag or 'latest'
+
+        # Construct full name (a digest pins the image, so it replaces the tag)
         if digest:
+            digest = f'sha256:{digest}'
             full_name = f'{registry}/{repository}@{digest}'
+        else:
+            full_name = f'{registry}/{repository}:{tag}'
+
+        return ImageInfo(
+            registry=registry,
+            repository=repository,
+            tag=tag,
+            digest=digest,
+            full_name=full_name,
+            original=image_name
+        )
+
+    @staticmethod
+    def normalize_image_name(image_name: str) -> str:
+        """
+        Normalize a container image name to its full form
 
-        return {
-            'registry': registry,
-            'repository': repository,
-            'tag': tag,
-            'digest': digest,
-            'full_name': full_name,
-            'original': image_name if not digest else f'{image_name}@{digest}'
-        }
+        Args:
+            image_name: Image name as referenced by the container
+
+        Returns:
+            Full image identifier (served from the parse cache on repeat names)
+        """
+        return ImageParser.parse(image_name).full_name
@@ -0,0 +1,50 @@
+"""
+JSON encoding helpers
+Uses orjson when it is installed and falls back to the standard library otherwise
+"""
+import dataclasses
+import json
+from typing import Any, Union
+
+try:
+    import orjson
+except ImportError:  # pinned in requirements.txt, but keep working on deployments without it
+    orjson = None
+
+
+def _default(obj: Any) -> Any:
+    """Serialize dataclasses the way orjson does natively"""
+    if dataclasses.is_dataclass(obj) and not isinstance(obj, type):
+        return dataclasses.asdict(obj)
+    raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+
+
+def loads(data: Union[bytes, str]) -> Any:
+    """
+    Parse a JSON document
+
+    Args:
+        data: JSON as bytes or str (bytes are parsed without decoding first)
+
+    Returns:
+        Parsed object
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dumps(obj: Any, indent: bool = False) -> bytes:
+    """
+    Serialize an object to UTF-8 JSON bytes
+
+    Args:
+        obj: Object to serialize (dicts, lists, dataclasses, ...)
+        indent: Pretty-print with two-space indentation
+
+    Returns:
+        JSON document as bytes
+    """
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else None)
+    return json.dumps(obj, indent=2 if indent else None, default=_default).encode('utf-8')
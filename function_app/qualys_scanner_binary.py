@@ -4,13 +4,71 @@ Runs qscanner binary directly in the function runtime
 Auto-downloads latest qscanner binary on first use
 """
 import os
-import json
+import shutil
+import hashlib
 import logging
+import functools
 import subprocess
+import tempfile
+import threading
 import urllib.request
-from typing import Dict, Optional
-from datetime import datetime
-from pathlib import Path
+from collections import Counter
+from typing import BinaryIO, Dict, Optional
+from datetime import datetime, timezone
+
+import json_codec
+
+
+# Worker configuration, read once per process
+AZURE_SUBSCRIPTION_ID = os.environ.get('AZURE_SUBSCRIPTION_ID', 'unknown')
+QUALYS_POD = os.environ.get('QUALYS_POD')
+QUALYS_ACCESS_TOKEN = os.environ.get('QUALYS_ACCESS_TOKEN')
+SCAN_TIMEOUT = int(os.environ.get('SCAN_TIMEOUT', '1800'))
+QSCANNER_VERSION = os.environ.get('QSCANNER_VERSION', '4.6.0-4')
+# The parsed report is large and never persisted; only keep it on results when debugging
+KEEP_RAW_OUTPUT = os.environ.get('QSCANNER_KEEP_RAW_OUTPUT', 'false').lower() == 'true'
+
+# Qualys numeric severities and the keywords used by textual ones, in precedence order
+_SEVERITY_LEVELS = {
+    '5': 'CRITICAL',
+    '4': 'HIGH',
+    '3': 'MEDIUM',
+    '2': 'LOW',
+    '1': 'INFORMATIONAL'
+}
+_SEVERITY_KEYWORDS = (
+    ('CRIT', 'CRITICAL'),
+    ('HIGH', 'HIGH'),
+    ('MED', 'MEDIUM'),
+    ('LOW', 'LOW'),
+    ('INFO', 'INFORMATIONAL')
+)
+
+
+@functools.lru_cache(maxsize=256, typed=True)
+def _severity_label(severity) -> str:
+    """
+    Map a qscanner severity to one of the summary levels
+
+    A report only uses a handful of distinct severity values, so results are
+    cached and the keyword scan runs once per value rather than once per finding.
+
+    Args:
+        severity: Numeric or textual severity from the report (must be hashable)
+
+    Returns:
+        CRITICAL, HIGH, MEDIUM, LOW or INFORMATIONAL (MEDIUM if unrecognized)
+    """
+    severity = str(severity).upper()
+
+    if severity in _SEVERITY_LEVELS:
+        return _SEVERITY_LEVELS[severity]
+
+    for keyword, level in _SEVERITY_KEYWORDS:
+        if keyword in severity:
+            return level
+
+    return 'MEDIUM'
 
 
 class QScannerBinary:
@@ -19,6 +77,12 @@ class QScannerBinary:
     Much simpler and cheaper than spinning up ACI containers
     """
 
+    # The binary is located (or downloaded) and the subprocess environment built once
+    # per process, then shared by all instances
+    _shared_qscanner_path = None
+    _shared_scan_env = None
+    _setup_lock = threading.Lock()
+
     def __init__(self, subscription_id: Optional[str] = None):
         """
         Initialize scanner with Qualys credentials
@@ -27,16 +91,33 @@ class QScannerBinary:
             subscription_id: Optional subscription ID for tracking.
                            If not provided, uses AZURE_SUBSCRIPTION_ID env var.
         """
-        self.subscription_id = subscription_id or os.environ.get('AZURE_SUBSCRIPTION_ID', 'unknown')
+        self.subscription_id = subscription_id or AZURE_SUBSCRIPTION_ID
 
         # qscanner configuration
-        self.qualys_pod = os.environ.get('QUALYS_POD')
-        self.qualys_access_token = os.environ.get('QUALYS_ACCESS_TOKEN')
-        self.scan_timeout = int(os.environ.get('SCAN_TIMEOUT', '1800'))
+        self.qualys_pod = QUALYS_POD
+        self.qualys_access_token = QUALYS_ACCESS_TOKEN
+        self.scan_timeout = SCAN_TIMEOUT
 
         # Find or download qscanner binary
-        self.qscanner_path = self._find_qscanner_binary()
-        logging.info(f'Using qscanner binary at: {self.qscanner_path}')
+        if QScannerBinary._shared_qscanner_path is None:
+            with QScannerBinary._setup_lock:
+                if QScannerBinary._shared_qscanner_path is None:
+                    QScannerBinary._shared_scan_env = self._build_scan_env()
+                    QScannerBinary._shared_qscanner_path = self._find_qscanner_binary()
+                    logging.info('Using qscanner binary at: %s', QScannerBinary._shared_qscanner_path)
+        self.qscanner_path = QScannerBinary._shared_qscanner_path
+        self.scan_env = QScannerBinary._shared_scan_env
+
+        # Only the image and tags vary per scan; the rest of the command line is fixed
+        self.base_cmd = (
+            self.qscanner_path,
+            '--pod', self.qualys_pod,
+            '--scan-types', 'os,sca,secret',
+            '--format', 'json',
+            '--access-token', self.qualys_access_token,
+            '--save',
+            '--skip-verify-tls',
+        )
 
     def _find_qscanner_binary(self) -> Optional[str]:
         """
@@ -48,28 +129,28 @@ class QScannerBinary:
         # Check for bundled binary first (deployed with function app)
         bundled_path = os.path.join(os.path.dirname(__file__), 'qscanner')
         if os.path.isfile(bundled_path) and os.access(bundled_path, os.X_OK):
-            logging.info(f'Using bundled qscanner binary at {bundled_path}')
+            logging.info('Using bundled qscanner binary at %s', bundled_path)
             return bundled_path
 
         # Check for bundled tar.gz (for new deployments)
-        version = os.environ.get('QSCANNER_VERSION', '4.6.0-4')
+        version = QSCANNER_VERSION
         bundled_targz = os.path.join(os.path.dirname(__file__), f'qscanner-{version}.linux-amd64.tar.gz')
         if os.path.isfile(bundled_targz):
-            logging.info(f'Found bundled qscanner tar.gz at {bundled_targz}, extracting...')
+            logging.info('Found bundled qscanner tar.gz at %s, extracting...', bundled_targz)
             try:
                 extracted_path = self._extract_bundled_targz(bundled_targz, bundled_path)
                 if os.path.isfile(extracted_path) and os.access(extracted_path, os.X_OK):
-                    logging.info(f'Successfully extracted bundled qscanner to {extracted_path}')
+                    logging.info('Successfully extracted bundled qscanner to %s', extracted_path)
                     return extracted_path
             except Exception as e:
-                logging.warning(f'Failed to extract bundled tar.gz: {str(e)}, will try other options')
+                logging.warning('Failed to extract bundled tar.gz: %s, will try other options', e)
 
         # Persistent storage path (survives across function executions)
         persistent_path = '/home/qscanner'
 
         # Check if binary already exists in persistent storage
         if os.path.isfile(persistent_path) and os.access(persistent_path, os.X_OK):
-            logging.info(f'Using existing qscanner binary at {persistent_path}')
+            logging.info('Using existing qscanner binary at %s', persistent_path)
             return persistent_path
 
         # Download binary as last resort
@@ -86,14 +167,13 @@ class QScannerBinary:
         Returns:
             Path to downloaded binary
         """
-        version = os.environ.get('QSCANNER_VERSION', '4.6.0-4')
+        version = QSCANNER_VERSION
         download_url = f'https://cask.qg1.apps.qualys.com/cs/p/MwmsS_SfM0RTBIc5r-hpCUmY34xkB4n93rJNAfOf_BH5BnExjNT7P-48_03RUMr_/n/qualysincgov/b/us01-cask-artifacts/o/cs/qscanner/{version}/qscanner-{version}.linux-amd64.tar.gz'
 
         try:
             import tarfile
-            import tempfile
 
-            logging.info(f'Downloading qscanner v{version} from Qualys CASK')
+            logging.info('Downloading qscanner v%s from Qualys CASK', version)
 
             # Create parent directory if needed
             os.makedirs(os.path.dirname(target_path), exist_ok=True)
@@ -102,7 +182,7 @@ class QScannerBinary:
             temp_dir = tempfile.mkdtemp()
             tar_path = os.path.join(temp_dir, 'qscanner.tar.gz')
 
-            logging.info(f'Downloading archive to {tar_path}')
+            logging.info('Downloading archive to %s', tar_path)
             urllib.request.urlretrieve(download_url, tar_path)
 
             # Extract tar.gz
@@ -115,11 +195,7 @@ class QScannerBinary:
             if not os.path.isfile(binary_source):
                 raise Exception(f'Binary not found in archive at {binary_source}')
 
-            import shutil
-            shutil.move(binary_source, target_path)
-
-            # Make executable
-            os.chmod(target_path, 0o755)
+            self._install_binary(binary_source, target_path)
 
             # Clean up temp directory
             shutil.rmtree(temp_dir)
@@ -127,14 +203,14 @@ class QScannerBinary:
             # Verify
             if os.path.isfile(target_path) and os.access(target_path, os.X_OK):
                 size = os.path.getsize(target_path)
-                logging.info(f'Successfully downloaded qscanner binary ({size} bytes)')
+                logging.info('Successfully downloaded qscanner binary (%s bytes)', size)
                 return target_path
             else:
                 raise Exception('Downloaded binary is not executable')
 
         except Exception as e:
-            logging.error(f'Failed to download qscanner binary: {str(e)}')
-            raise Exception(f'Cannot download qscanner binary: {str(e)}. Please check QSCANNER_VERSION env var and network connectivity.')
+            logging.error('Failed to download qscanner binary: %s', e)
+            raise Exception(f'Cannot download qscanner binary: {str(e)}. Please check QSCANNER_VERSION env var and network connectivity.') from e
 
     def _extract_bundled_targz(self, targz_path: str, target_path: str) -> str:
         """
@@ -148,14 +224,12 @@ class QScannerBinary:
             Path to extracted binary
         """
         import tarfile
-        import tempfile
-        import shutil
 
         try:
             # Create temp directory for extraction
             temp_dir = tempfile.mkdtemp()
 
-            logging.info(f'Extracting {targz_path} to temp directory')
+            logging.info('Extracting %s to temp directory', targz_path)
             with tarfile.open(targz_path, 'r:gz') as tar:
                 tar.extractall(temp_dir)
 
@@ -164,20 +238,56 @@ class QScannerBinary:
             if not os.path.isfile(binary_source):
                 raise Exception(f'Binary not found in archive at {binary_source}')
 
-            # Move to target location
-            shutil.move(binary_source, target_path)
-
-            # Make executable
-            os.chmod(target_path, 0o755)
+            # Verify and move to target location
+            self._install_binary(binary_source, target_path)
 
             # Clean up temp directory
             shutil.rmtree(temp_dir)
 
-            logging.info(f'Extracted qscanner binary to {target_path}')
+            logging.info('Extracted qscanner binary to %s', target_path)
             return target_path
 
         except Exception as e:
-            logging.error(f'Failed to extract bundled tar.gz: {str(e)}')
+            logging.error('Failed to extract bundled tar.gz: %s', e)
+            raise
+
+    @staticmethod
+    def _install_binary(binary_source: str, target_path: str):
+        """
+        Verify an extracted qscanner binary and install it
+
+        The binary is checked against the qscanner.sha256 shipped in the same archive,
+        then copied to a private staging file and renamed into place, so an interrupted
+        or concurrent install never leaves a truncated binary at target_path for later
+        cold starts to pick up.
+
+        Args:
+            binary_source: Extracted binary (next to its qscanner.sha256)
+            target_path: Where to install the binary
+        """
+        checksum_path = f'{binary_source}.sha256'
+        if os.path.isfile(checksum_path):
+            with open(checksum_path) as f:
+                expected = f.read().strip().split(' ')[0].lower()
+            with open(binary_source, 'rb') as f:
+                actual = hashlib.file_digest(f, 'sha256').hexdigest()
+            if actual != expected:
+                raise Exception(f'qscanner checksum mismatch: expected {expected}, got {actual}')
+            logging.info('Verified qscanner SHA-256 %s', actual)
+        else:
+            logging.warning('No qscanner.sha256 in archive, skipping checksum verification')
+
+        # Unique staging file on the target's filesystem: instances cold-starting together
+        # on the shared /home mount must not write into the same file
+        fd, staging_path = tempfile.mkstemp(prefix='.qscanner-', dir=os.path.dirname(target_path) or '.')
+        os.close(fd)
+        try:
+            shutil.move(binary_source, staging_path)
+            os.chmod(staging_path, 0o755)
+            os.replace(staging_path, target_path)
+        except Exception:
+            if os.path.exists(staging_path):
+                os.unlink(staging_path)
             raise
 
     def scan_image(self, registry: str, repository: str, tag: str = 'latest',
@@ -195,64 +305,148 @@ class QScannerBinary:
         Returns:
             Dictionary containing scan results
         """
+        return self.wait_for_scan(self.submit_scan(registry, repository, tag, digest, custom_tags))
+
+    def submit_scan(self, registry: str, repository: str, tag: str = 'latest',
+                    digest: Optional[str] = None, custom_tags: Optional[Dict] = None) -> Dict:
+        """
+        Start a qscanner scan without waiting for it to finish
+
+        Args:
+            registry: Container registry
+            repository: Image repository
+            tag: Image tag
+            digest: Optional image digest
+            custom_tags: Optional custom tags for tracking
+
+        Returns:
+            Scan handle to pass to wait_for_scan
+        """
         # Construct image identifier
         image_id = f'{registry}/{repository}:{tag}'
         if digest:
             image_id = f'{registry}/{repository}@{digest}'
 
-        logging.info(f'Scanning image with qscanner binary: {image_id}')
+        logging.info('Scanning image with qscanner binary: %s', image_id)
 
+        # The report can be many MB; qscanner writes it to an unlinked temp file that is
+        # read back in one go instead of being buffered chunk by chunk through a pipe
+        output = tempfile.TemporaryFile()
         try:
-            # Run qscanner and get output
-            scan_output = self._run_qscanner(image_id, custom_tags)
+            process = self._start_qscanner(image_id, custom_tags, output)
+        except Exception as e:
+            output.close()
+            logging.error('Error scanning image %s: %s', image_id, e)
+            raise
+
+        return {
+            'image': image_id,
+            'registry': registry,
+            'repository': repository,
+            'tag': tag,
+            'digest': digest,
+            'process': process,
+            'output': output
+        }
+
+    def wait_for_scan(self, handle: Dict) -> Dict:
+        """
+        Wait for a submitted scan to finish and parse its results
+
+        Args:
+            handle: Scan handle returned by submit_scan
+
+        Returns:
+            Dictionary containing scan results
+        """
+        image_id = handle['image']
+
+        try:
+            # Wait for qscanner and get output
+            scan_output = self._wait_for_qscanner(handle['process'], handle['output'])
 
             # Parse results
             scan_results = self._parse_qscanner_output(scan_output)
+            now = datetime.now(timezone.utc)
 
-            return {
-                'scan_id': scan_results.get('scanId', datetime.utcnow().strftime('%Y%m%d%H%M%S')),
+            result = {
+                'scan_id': scan_results.get('scanId') or now.strftime('%Y%m%d%H%M%S'),
                 'status': 'COMPLETED',
                 'image': image_id,
                 'vulnerabilities': self._parse_vulnerabilities(scan_results),
                 'compliance': self._parse_compliance(scan_results),
                 'metadata': {
-                    'registry': registry,
-                    'repository': repository,
-                    'tag': tag,
-                    'digest': digest,
-                    'scan_timestamp': datetime.utcnow().isoformat(),
-                    'scanner': 'qscanner-binary',
-                    'raw_output': scan_results
+                    'registry': handle['registry'],
+                    'repository': handle['repository'],
+                    'tag': handle['tag'],
+                    'digest': handle['digest'],
+                    'scan_timestamp': now.isoformat(),
+                    'scanner': 'qscanner-binary'
                 }
             }
+            if KEEP_RAW_OUTPUT:
+                result['metadata']['raw_output'] = scan_results
+            return result
 
         except Exception as e:
-            logging.error(f'Error scanning image {image_id}: {str(e)}')
+            logging.error('Error scanning image %s: %s', image_id, e)
             raise
 
-    def _run_qscanner(self, image_id: str, custom_tags: Optional[Dict] = None) -> str:
+    def _build_scan_env(self) -> Optional[Dict[str, str]]:
+        """
+        Build the qscanner subprocess environment
+
+        Returns:
+            Environment variables for qscanner runs, or None to inherit the worker's
+            environment unchanged
+        """
+        # Environment - Configure Azure SDK for ACR authentication
+        # QScanner uses Azure SDK which automatically detects managed identity in Azure Functions
+        # via MSI_ENDPOINT and MSI_SECRET environment variables (auto-provided by Azure)
+        env = os.environ
+
+        # For Azure ACR with system-assigned managed identity:
+        # - MSI_ENDPOINT: Auto-provided by Azure Functions (enables managed identity)
+        # - AZURE_TENANT_ID: The Azure AD tenant ID (configured in function app settings)
+        # - QSCANNER_REGISTRY_USERNAME: MUST NOT be set (conflicts with Azure SDK auth)
+
+        # Verify managed identity is available (Azure Functions provides MSI_ENDPOINT)
+        if 'MSI_ENDPOINT' in env:
+            logging.info('Using Azure system-assigned managed identity for ACR authentication')
+            logging.info('  MSI Endpoint: %.50s...', env['MSI_ENDPOINT'])
+            logging.info('  Tenant ID: %s', env.get('AZURE_TENANT_ID', 'not set'))
+
+            # Ensure QSCANNER_REGISTRY_USERNAME is NOT set (critical for Azure SDK auth)
+            if 'QSCANNER_REGISTRY_USERNAME' in env:
+                logging.warning('Removing QSCANNER_REGISTRY_USERNAME (conflicts with Azure SDK)')
+                env = env.copy()
+                del env['QSCANNER_REGISTRY_USERNAME']
+                return env
+        else:
+            logging.warning('MSI_ENDPOINT not found - not running in Azure Functions or managed identity not enabled')
+            logging.warning('ACR authentication may fail for private registries')
+
+        # Nothing to change, so let qscanner inherit the environment without a copy
+        return None
+
+    def _start_qscanner(self, image_id: str, custom_tags: Optional[Dict], output: BinaryIO) -> subprocess.Popen:
         """
-        Run qscanner binary as subprocess with remote registry scanning (Option 3)
+        Start qscanner binary as subprocess with remote registry scanning (Option 3)
 
         Args:
             image_id: Full image identifier to scan (e.g., myacr.azurecr.io/image:tag)
             custom_tags: Optional tags for scan tracking
+            output: File that receives qscanner's stdout (the JSON report)
 
         Returns:
-            qscanner output (JSON)
+            Running qscanner process
         """
         # Build command for Option 3: Remote Images with ACR
         # Per Qualys ACR documentation: ./qscanner --pod US2 image <project>.azurecr.io/<image>:<tag>
         # The 'image' subcommand works for both local images (Option 1) and remote images (Option 3)
         # QScanner auto-detects it's a remote ACR URL and uses Azure SDK to authenticate via managed identity
         cmd = [
-            self.qscanner_path,
-            '--pod', self.qualys_pod,
-            '--scan-types', 'os,sca,secret',
-            '--format', 'json',
-            '--access-token', self.qualys_access_token,
-            '--save',
-            '--skip-verify-tls',
+            *self.base_cmd,
             'image',  # Required per Qualys ACR docs
             image_id  # Image URL (e.g., myacr.azurecr.io/app:latest)
         ]
@@ -262,85 +456,96 @@ class QScannerBinary:
             for key, value in custom_tags.items():
                 cmd.extend(['--tag', f'{key}={value}'])
 
-        # Environment - Configure Azure SDK for ACR authentication
-        # QScanner uses Azure SDK which automatically detects managed identity in Azure Functions
-        # via MSI_ENDPOINT and MSI_SECRET environment variables (auto-provided by Azure)
-        env = os.environ.copy()
-
-        # For Azure ACR with system-assigned managed identity:
-        # - MSI_ENDPOINT: Auto-provided by Azure Functions (enables managed identity)
-        # - AZURE_TENANT_ID: The Azure AD tenant ID (configured in function app settings)
-        # - QSCANNER_REGISTRY_USERNAME: MUST NOT be set (conflicts with Azure SDK auth)
+        logging.info('Running remote registry scan: %s', image_id)
+        logging.info('Command: qscanner --pod %s ... %s', self.qualys_pod, image_id)
 
-        # Verify managed identity is available (Azure Functions provides MSI_ENDPOINT)
-        if 'MSI_ENDPOINT' in env:
-            logging.info(f'Using Azure system-assigned managed identity for ACR authentication')
-            logging.info(f'  MSI Endpoint: {env["MSI_ENDPOINT"][:50]}...')
-            logging.info(f'  Tenant ID: {env.get("AZURE_TENANT_ID", "not set")}')
+        # Start qscanner; the report and stderr are collected by _wait_for_qscanner
+        return subprocess.Popen(
+            cmd,
+            env=self.scan_env,
+            stdout=output,
+            stderr=subprocess.PIPE
+        )
 
-            # Ensure QSCANNER_REGISTRY_USERNAME is NOT set (critical for Azure SDK auth)
-            if 'QSCANNER_REGISTRY_USERNAME' in env:
-                logging.warning('Removing QSCANNER_REGISTRY_USERNAME (conflicts with Azure SDK)')
-                del env['QSCANNER_REGISTRY_USERNAME']
-        else:
-            logging.warning('MSI_ENDPOINT not found - not running in Azure Functions or managed identity not enabled')
-            logging.warning('ACR authentication may fail for private registries')
+    def _wait_for_qscanner(self, process: subprocess.Popen, output: BinaryIO) -> bytes:
+        """
+        Wait for a running qscanner process and collect its output
 
-        logging.info(f'Running remote registry scan: {image_id}')
-        logging.info(f'Command: qscanner --pod {self.qualys_pod} ... {image_id}')
+        Args:
+            process: Process started by _start_qscanner
+            output: File the process writes its stdout to (closed here)
 
+        Returns:
+            Raw qscanner stdout (UTF-8 JSON bytes)
+        """
         try:
-            # Run qscanner
-            result = subprocess.run(
-                cmd,
-                env=env,
-                capture_output=True,
-                text=True,
-                timeout=self.scan_timeout,
-                check=False  # Don't raise on non-zero exit (qscanner may exit 1 with findings)
-            )
+            try:
+                _, stderr = process.communicate(timeout=self.scan_timeout)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.communicate()
+                raise
+
+            output.seek(0)
+            stdout = output.read()
 
             # Log output
-            logging.info(f'qscanner completed with exit code {result.returncode}')
+            logging.info('qscanner completed with exit code %s', process.returncode)
 
             # Log stdout and stderr for debugging
-            if result.stdout:
-                logging.info(f'qscanner stdout (first 500 chars): {result.stdout[:500]}')
-            if result.stderr:
-                logging.warning(f'qscanner stderr: {result.stderr}')
+            if stdout:
+                logging.info('qscanner stdout (first 500 chars): %s', stdout[:500].decode('utf-8', 'replace'))
+            if stderr:
+                logging.warning('qscanner stderr: %s', stderr.decode('utf-8', 'replace'))
 
             # Exit codes 0 and 1 are acceptable (1 = vulnerabilities found)
-            if result.returncode not in [0, 1]:
-                logging.error(f'qscanner exited with unexpected code {result.returncode}')
-                raise Exception(f'qscanner failed with exit code {result.returncode}')
+            if process.returncode not in [0, 1]:
+                logging.error('qscanner exited with unexpected code %s', process.returncode)
+                raise Exception(f'qscanner failed with exit code {process.returncode}')
 
-            # Return stdout (JSON output)
-            return result.stdout
+            # Return stdout undecoded; the JSON parser reads bytes directly
+            return stdout
 
         except subprocess.TimeoutExpired:
-            logging.error(f'qscanner timed out after {self.scan_timeout} seconds')
+            logging.error('qscanner timed out after %s seconds', self.scan_timeout)
             raise TimeoutError(f'qscanner scan timed out after {self.scan_timeout} seconds')
+        finally:
+            output.close()
 
-        except Exception as e:
-            logging.error(f'Error running qscanner: {str(e)}')
-            raise
-
-    def _parse_qscanner_output(self, output: str) -> Dict:
+    def _parse_qscanner_output(self, output: bytes) -> Dict:
         """Parse qscanner JSON output"""
         try:
-            # qscanner outputs JSON
-            data = json.loads(output)
+            # qscanner outputs JSON; reports with many findings are large, so use the fast decoder
+            data = json_codec.loads(output)
             logging.info('Successfully parsed qscanner JSON output')
             return data
-        except json.JSONDecodeError as e:
-            logging.error(f'Failed to parse qscanner output as JSON: {str(e)}')
-            logging.debug(f'Output was: {output[:500]}...')
+        except ValueError as e:  # json.JSONDecodeError and orjson.JSONDecodeError
+            data = self._parse_embedded_json(output)
+            if data is not None:
+                return data
+            logging.exception('Failed to parse qscanner output as JSON')
+            text = output.decode('utf-8', 'replace')
+            logging.debug('Output was: %.500s...', text)
             return {
                 'status': 'PARSE_ERROR',
-                'raw_output': output,
+                'raw_output': text,
                 'error': str(e)
             }
 
+    @staticmethod
+    def _parse_embedded_json(output: bytes) -> Optional[Dict]:
+        """Parse the outermost JSON object when qscanner printed other lines around it"""
+        start, end = output.find(b'{'), output.rfind(b'}') + 1
+        if start < 0 or end <= start or (start == 0 and end == len(output)):
+            return None
+        try:
+            data = json_codec.loads(output[start:end])
+        except ValueError:
+            return None
+        logging.info('Parsed qscanner JSON report after skipping %d bytes of other output',
+                     len(output) - (end - start))
+        return data
+
     def _parse_vulnerabilities(self, scan_results: Dict) -> Dict:
         """Parse vulnerability information from qscanner results"""
         vuln_summary = {
@@ -360,27 +565,48 @@ class QScannerBinary:
         elif 'results' in scan_results and 'vulnerabilities' in scan_results['results']:
             vulnerabilities = scan_results['results']['vulnerabilities']
 
+        severities = []
         for vuln in vulnerabilities:
-            severity = self._normalize_severity(vuln.get('severity', 'UNKNOWN'))
-            if severity in vuln_summary:
-                vuln_summary[severity] += 1
-            vuln_summary['total'] += 1
-
-            vuln_summary['details'].append({
-                'qid': vuln.get('qid') or vuln.get('id'),
-                'cve': vuln.get('cve') or vuln.get('cveId'),
-                'severity': severity,
-                'title': vuln.get('title') or vuln.get('name'),
-                'package': vuln.get('package', {}).get('name') if isinstance(vuln.get('package'), dict) else vuln.get('packageName'),
-                'version': vuln.get('package', {}).get('version') if isinstance(vuln.get('package'), dict) else vuln.get('packageVersion'),
-                'fixed_version': vuln.get('fixedVersion') or vuln.get('fix')
-            })
+            severity = vuln.get('severity', 'UNKNOWN')
+            # Only scalars can key the label cache; anything else is matched on its text
+            if not isinstance(severity, (str, int, float)):
+                severity = str(severity)
+            severities.append(_severity_label(severity))
+        counts = Counter(severities)
+        for severity in ('CRITICAL', 'HIGH', 'MEDIUM', 'LOW', 'INFORMATIONAL'):
+            vuln_summary[severity] = counts[severity]
+        vuln_summary['total'] = len(severities)
+
+        vuln_summary['details'] = [
+            self._vulnerability_detail(vuln, severity)
+            for vuln, severity in zip(vulnerabilities, severities)
+        ]
 
-        logging.info(f'Parsed {vuln_summary["total"]} vulnerabilities: '
-                    f'Critical={vuln_summary["CRITICAL"]}, High={vuln_summary["HIGH"]}')
+        logging.info('Parsed %d vulnerabilities: Critical=%d, High=%d',
+                     vuln_summary['total'], vuln_summary['CRITICAL'], vuln_summary['HIGH'])
 
         return vuln_summary
 
+    @staticmethod
+    def _vulnerability_detail(vuln: Dict, severity: str) -> Dict:
+        """Flatten one qscanner finding into the stored details format"""
+        get = vuln.get
+        package = get('package')
+        if isinstance(package, dict):
+            package_name, package_version = package.get('name'), package.get('version')
+        else:
+            package_name, package_version = get('packageName'), get('packageVersion')
+
+        return {
+            'qid': get('qid') or get('id'),
+            'cve': get('cve') or get('cveId'),
+            'severity': severity,
+            'title': get('title') or get('name'),
+            'package': package_name,
+            'version': package_version,
+            'fixed_version': get('fixedVersion') or get('fix')
+        }
+
     def _parse_compliance(self, scan_results: Dict) -> Dict:
         """Parse compliance information from qscanner results"""
         compliance = {
@@ -413,31 +639,3 @@ class QScannerBinary:
             })
 
         return compliance
-
-    def _normalize_severity(self, severity: str) -> str:
-        """Normalize severity levels"""
-        severity = str(severity).upper()
-
-        severity_map = {
-            '5': 'CRITICAL',
-            '4': 'HIGH',
-            '3': 'MEDIUM',
-            '2': 'LOW',
-            '1': 'INFORMATIONAL'
-        }
-
-        if severity in severity_map:
-            return severity_map[severity]
-
-        if 'CRIT' in severity:
-            return 'CRITICAL'
-        elif 'HIGH' in severity:
-            return 'HIGH'
-        elif 'MED' in severity:
-            return 'MEDIUM'
-        elif 'LOW' in severity:
-            return 'LOW'
-        elif 'INFO' in severity:
-            return 'INFORMATIONAL'
-
-        return 'MEDIUM'
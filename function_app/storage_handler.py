@@ -2,14 +2,76 @@
 Azure Storage handler for scan results and metadata
 """
 import os
-import json
+import time
 import logging
-from datetime import datetime, timedelta
-from typing import Dict, Optional
+import threading
+import concurrent.futures
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Set, Union
 from azure.storage.blob import BlobServiceClient, BlobClient
 from azure.data.tables import TableServiceClient, TableEntity
 from azure.core.exceptions import ResourceNotFoundError
 
+import json_codec
+from qualys_scanner_binary import SCAN_TIMEOUT
+
+# Default "recently scanned" window, read once per worker process
+SCAN_CACHE_HOURS = int(os.environ.get('SCAN_CACHE_HOURS', '24'))
+
+# Seconds a storage hit is trusted by the process-local cache
+SCAN_CACHE_TTL = int(os.environ.get('SCAN_CACHE_TTL', '300'))
+
+# An in-flight marker older than the qscanner timeout belongs to a scan that died
+# (host timeout, worker recycle) and no longer counts as a recent scan
+SUBMITTED_MARKER_TTL = SCAN_TIMEOUT
+
+# Worker threads for concurrent per-partition recent-scan lookups
+QUERY_CONCURRENCY = 8
+
+# ASCII characters not allowed in partition keys / blob names, mapped to '_'
+_SANITIZE_TABLE = {code: '_' for code in range(128) if not (chr(code).isalnum() or chr(code) in '-_.')}
+
+
+@dataclass(slots=True)
+class ScanRecord:
+    """
+    Summary of a single image scan, as persisted to blob and table storage
+    """
+    timestamp: str
+    container_type: str
+    image: str
+    resource_id: str
+    scan_id: Optional[str]
+    status: Optional[str]
+    vulnerabilities: Dict = field(default_factory=dict)
+    compliance: Dict = field(default_factory=dict)
+    scan_method: str = 'remote_registry'
+
+    @classmethod
+    def from_dict(cls, result: Dict) -> 'ScanRecord':
+        """
+        Build a record from a scan result dictionary
+
+        Args:
+            result: Scan result dictionary
+
+        Returns:
+            Equivalent ScanRecord
+        """
+        return cls(
+            timestamp=result.get('timestamp') or datetime.now(timezone.utc).isoformat(),
+            container_type=result.get('container_type', 'UNKNOWN'),
+            image=result.get('image', 'unknown'),
+            resource_id=result.get('resource_id'),
+            scan_id=result.get('scan_id'),
+            status=result.get('status'),
+            vulnerabilities=result.get('vulnerabilities') or {},
+            compliance=result.get('compliance') or {},
+            scan_method=result.get('scan_method', 'remote_registry')
+        )
+
 
 class StorageHandler:
     """
@@ -17,21 +79,37 @@ class StorageHandler:
     Uses Blob Storage for detailed results and Table Storage for metadata
     """
 
-    def __init__(self, connection_string: str):
+    def __init__(self, connection_string: str, transport=None):
         """
         Initialize storage handler
 
         Args:
             connection_string: Azure Storage connection string
+            transport: Optional azure-core HTTP transport to share a connection pool with other clients
         """
         self.connection_string = connection_string
-        self.blob_service = BlobServiceClient.from_connection_string(connection_string)
-        self.table_service = TableServiceClient.from_connection_string(connection_string)
+        client_kwargs = {'transport': transport} if transport is not None else {}
+        self.blob_service = BlobServiceClient.from_connection_string(connection_string, **client_kwargs)
+        self.table_service = TableServiceClient.from_connection_string(connection_string, **client_kwargs)
 
         # Container and table names
         self.results_container = 'scan-results'
         self.metadata_table = 'ScanMetadata'
 
+        # Concurrent per-partition lookups for recent-scan checks
+        self._query_executor = concurrent.futures.ThreadPoolExecutor(max_workers=QUERY_CONCURRENCY,
+                                                                     thread_name_prefix='table')
+        # Row written while a scan is in flight
+        self.submitted_row_key = 'submitted'
+
+        # Process-local LRU of recently scanned images (image -> monotonic expiry).
+        # Entries are only trusted for SCAN_CACHE_TTL, so deleting a table row (force rescan)
+        # takes effect on warm workers within that time.
+        self._recent_cache = OrderedDict()
+        self._recent_lock = threading.Lock()
+        self.recent_cache_ttl = min(SCAN_CACHE_TTL, SCAN_CACHE_HOURS * 3600)
+        self.recent_cache_size = 4096
+
         # Initialize storage
         self._ensure_storage_exists()
 
@@ -40,75 +118,168 @@ class StorageHandler:
         try:
             # Create blob container
             self.blob_service.create_container(self.results_container)
-            logging.info(f'Created blob container: {self.results_container}')
+            logging.info('Created blob container: %s', self.results_container)
         except Exception as e:
-            logging.debug(f'Blob container already exists or error: {str(e)}')
+            logging.debug('Blob container already exists or error: %s', e)
 
         try:
             # Create table
             self.table_service.create_table(self.metadata_table)
-            logging.info(f'Created table: {self.metadata_table}')
+            logging.info('Created table: %s', self.metadata_table)
         except Exception as e:
-            logging.debug(f'Table already exists or error: {str(e)}')
+            logging.debug('Table already exists or error: %s', e)
 
-    def save_scan_result(self, result: Dict):
+    def save_scan_result(self, result: Union['ScanRecord', Dict]):
         """
         Save scan result to storage
 
         Args:
-            result: Scan result dictionary
+            result: Scan record or scan result dictionary
+        """
+        self.save_scan_results([result])
+
+    def save_scan_results(self, results: List[Union['ScanRecord', Dict]]):
+        """
+        Save a batch of scan results to storage
+
+        Detailed results go to blob storage and table metadata is upserted, one entity
+        per result
+
+        Args:
+            results: Scan records (plain dictionaries are converted)
         """
         try:
-            image = result.get('image', 'unknown')
-            scan_id = result.get('scan_id', datetime.utcnow().strftime('%Y%m%d%H%M%S'))
-            timestamp = result.get('timestamp', datetime.utcnow().isoformat())
+            records = [r if isinstance(r, ScanRecord) else ScanRecord.from_dict(r) for r in results]
 
             # Save detailed results to blob storage
-            blob_name = f'{self._sanitize_name(image)}/{scan_id}.json'
-            blob_client = self.blob_service.get_blob_client(
-                container=self.results_container,
-                blob=blob_name
-            )
+            entities = [self._save_result_blob(record) for record in records]
 
-            blob_client.upload_blob(
-                json.dumps(result, indent=2),
-                overwrite=True,
-                metadata={
-                    'image': image,
-                    'scan_id': scan_id,
-                    'timestamp': timestamp
-                }
-            )
+            # Save metadata to table storage. Rows are partitioned per image and images are
+            # deduplicated before scanning, so there are never two rows for one partition
+            # to group into an entity-group transaction
+            table_client = self.table_service.get_table_client(self.metadata_table)
+            for entity in entities:
+                table_client.upsert_entity(entity)
 
-            logging.info(f'Saved scan result to blob: {blob_name}')
+            logging.info('Saved scan metadata to table for %d results', len(records))
+            self._remember_recent([record.image for record in records])
 
-            # Save metadata to table storage
-            table_client = self.table_service.get_table_client(self.metadata_table)
+        except Exception as e:
+            logging.error('Error saving scan result: %s', e)
+            raise
+
+    def _save_result_blob(self, record: 'ScanRecord') -> Dict:
+        """
+        Upload a detailed scan result to blob storage
+
+        Args:
+            record: Scan record
+
+        Returns:
+            Table entity describing the result
+        """
+        image = record.image
+        scan_id = record.scan_id or datetime.now(timezone.utc).strftime('%Y%m%d%H%M%S')
+        timestamp = record.timestamp
+
+        blob_name = f'{self._sanitize_name(image)}/{scan_id}.json'
+        blob_client = self.blob_service.get_blob_client(
+            container=self.results_container,
+            blob=blob_name
+        )
+
+        # json_codec serializes slotted dataclasses directly
+        blob_client.upload_blob(
+            json_codec.dumps(record, indent=True),
+            overwrite=True,
+            metadata={
+                'image': image,
+                'scan_id': scan_id,
+                'timestamp': timestamp
+            }
+        )
+
+        logging.info('Saved scan result to blob: %s', blob_name)
+
+        vulnerabilities = record.vulnerabilities
+        compliance = record.compliance
+        return {
+            'PartitionKey': self._sanitize_name(image),
+            'RowKey': scan_id,
+            'Image': image,
+            'ScanId': scan_id,
+            'Timestamp': timestamp,
+            'Status': record.status or 'UNKNOWN',
+            'ContainerType': record.container_type,
+            'VulnCritical': vulnerabilities.get('CRITICAL', 0),
+            'VulnHigh': vulnerabilities.get('HIGH', 0),
+            'VulnMedium': vulnerabilities.get('MEDIUM', 0),
+            'VulnLow': vulnerabilities.get('LOW', 0),
+            'VulnTotal': vulnerabilities.get('total', 0),
+            'CompliancePassed': compliance.get('passed', 0),
+            'ComplianceFailed': compliance.get('failed', 0),
+            'BlobPath': blob_name
+        }
+
+    def mark_scan_submitted(self, image: str, container_type: str, timestamp: str):
+        """
+        Record an in-flight scan so concurrent lookups treat the image as recently scanned
 
-            entity = {
+        Args:
+            image: Image name
+            container_type: ACI or ACA
+            timestamp: Submission timestamp
+        """
+        self._remember_recent([image])
+
+        try:
+            table_client = self.table_service.get_table_client(self.metadata_table)
+            table_client.upsert_entity({
                 'PartitionKey': self._sanitize_name(image),
-                'RowKey': scan_id,
+                'RowKey': self.submitted_row_key,
                 'Image': image,
-                'ScanId': scan_id,
                 'Timestamp': timestamp,
-                'Status': result.get('status', 'UNKNOWN'),
-                'ContainerType': result.get('container_type', 'UNKNOWN'),
-                'VulnCritical': result.get('vulnerabilities', {}).get('CRITICAL', 0),
-                'VulnHigh': result.get('vulnerabilities', {}).get('HIGH', 0),
-                'VulnMedium': result.get('vulnerabilities', {}).get('MEDIUM', 0),
-                'VulnLow': result.get('vulnerabilities', {}).get('LOW', 0),
-                'VulnTotal': result.get('vulnerabilities', {}).get('total', 0),
-                'CompliancePassed': result.get('compliance', {}).get('passed', 0),
-                'ComplianceFailed': result.get('compliance', {}).get('failed', 0),
-                'BlobPath': blob_name
-            }
+                'Status': 'SUBMITTED',
+                'ContainerType': container_type
+            })
+        except Exception as e:
+            logging.warning('Error recording scan submission for %s: %s', image, e)
 
-            table_client.upsert_entity(entity)
-            logging.info(f'Saved scan metadata to table: {image}/{scan_id}')
+    def clear_scan_submitted(self, image: str):
+        """
+        Remove the in-flight marker for a scan that failed, so the image can be rescanned
 
-        except Exception as e:
-            logging.error(f'Error saving scan result: {str(e)}')
-            raise
+        Args:
+            image: Image name
+        """
+        with self._recent_lock:
+            self._recent_cache.pop(image, None)
+
+        self.clear_scan_markers([image])
+
+    def clear_scan_markers(self, images: List[str]):
+        """
+        Delete the in-flight marker rows of finished scans
+
+        Args:
+            images: Image names whose scans completed or failed
+        """
+        table_client = self.table_service.get_table_client(self.metadata_table)
+        for image in images:
+            try:
+                table_client.delete_entity(partition_key=self._sanitize_name(image), row_key=self.submitted_row_key)
+            except Exception as e:
+                logging.warning('Error clearing scan submission for %s: %s', image, e)
+
+    def save_errors(self, errors: List[Dict]):
+        """
+        Save error information for several failed scans
+
+        Args:
+            errors: Error details dictionaries
+        """
+        for error_info in errors:
+            self.save_error(error_info)
 
     def save_error(self, error_info: Dict):
         """
@@ -118,7 +289,7 @@ class StorageHandler:
             error_info: Error details dictionary
         """
         try:
-            timestamp = error_info.get('timestamp', datetime.utcnow().isoformat())
+            timestamp = error_info.get('timestamp', datetime.now(timezone.utc).isoformat())
             image = error_info.get('image', 'unknown')
 
             # Save to blob storage
@@ -129,14 +300,14 @@ class StorageHandler:
             )
 
             blob_client.upload_blob(
-                json.dumps(error_info, indent=2),
+                json_codec.dumps(error_info, indent=True),
                 overwrite=True
             )
 
-            logging.info(f'Saved error info to blob: {blob_name}')
+            logging.info('Saved error info to blob: %s', blob_name)
 
-        except Exception as e:
-            logging.error(f'Error saving error info: {str(e)}')
+        except Exception:
+            logging.exception('Error saving error info')
 
     def is_recently_scanned(self, image: str, hours: Optional[int] = None) -> bool:
         """
@@ -149,28 +320,118 @@ class StorageHandler:
         Returns:
             True if image was scanned within the specified time period
         """
+        return image in self.get_recently_scanned([image], hours)
+
+    def get_recently_scanned(self, images: List[str], hours: Optional[int] = None) -> Set[str]:
+        """
+        Find which of the given images were scanned recently, using one partition query per image
+
+        Args:
+            images: Image names
+            hours: Number of hours to consider as "recent" (defaults to SCAN_CACHE_HOURS env var or 24)
+
+        Returns:
+            Set of image names scanned within the specified time period
+        """
+        recent = set()
+        if not images:
+            return recent
+
+        # Serve repeat lookups from the process-local cache (default window only)
+        use_local_cache = hours is None
+        if use_local_cache:
+            recent.update(self._cached_recent(images))
+            images = [image for image in images if image not in recent]
+            if not images:
+                return recent
+
         try:
             if hours is None:
-                hours = int(os.environ.get('SCAN_CACHE_HOURS', '24'))
+                hours = SCAN_CACHE_HOURS
 
             table_client = self.table_service.get_table_client(self.metadata_table)
-            partition_key = self._sanitize_name(image)
 
-            # Query recent scans
-            cutoff_time = datetime.utcnow() - timedelta(hours=hours)
+            # Map partition keys back to the image names they were derived from
+            images_by_key = {}
+            for image in images:
+                images_by_key.setdefault(self._sanitize_name(image), []).append(image)
+
+            # Results count for the whole window, in-flight markers only while their scan can still be running
+            now = datetime.now(timezone.utc)
+            cutoff_time = (now - timedelta(hours=hours)).strftime('%Y-%m-%dT%H:%M:%SZ')
+            marker_cutoff_time = (now - timedelta(seconds=min(SUBMITTED_MARKER_TTL, hours * 3600))
+                                  ).strftime('%Y-%m-%dT%H:%M:%SZ')
+            recent_filter = (f"((RowKey ne '{self.submitted_row_key}' and Timestamp ge datetime'{cutoff_time}')"
+                             f" or (RowKey eq '{self.submitted_row_key}' and Timestamp ge datetime'{marker_cutoff_time}'))")
+
+            # OR-ing partition keys turns the query into a table scan, so look each
+            # partition up on its own and run the lookups concurrently
+            def partition_has_recent(key: str) -> bool:
+                entities = table_client.query_entities(query_filter=f"PartitionKey eq '{key}' and {recent_filter}",
+                                                       select=['RowKey'], results_per_page=1)
+                return next(iter(entities), None) is not None
+
+            keys = list(images_by_key)
+            if len(keys) == 1:
+                hits = [partition_has_recent(keys[0])]
+            else:
+                hits = list(self._query_executor.map(partition_has_recent, keys))
+
+            found = set()
+            for key, hit in zip(keys, hits):
+                if hit:
+                    found.update(images_by_key[key])
+
+            if found:
+                logging.info('Found recent scans for %d of %d images', len(found), len(images))
+                if use_local_cache:
+                    self._remember_recent(found)
+                recent.update(found)
 
-            query_filter = f"PartitionKey eq '{partition_key}' and Timestamp ge datetime'{cutoff_time.isoformat()}'"
-            entities = list(table_client.query_entities(query_filter=query_filter, select=['RowKey']))
+        except Exception as e:
+            logging.warning('Error checking recent scans: %s', e)
 
-            if entities:
-                logging.info(f'Found {len(entities)} recent scans for {image}')
-                return True
+        return recent
 
-            return False
+    def _cached_recent(self, images: List[str]) -> Set[str]:
+        """
+        Return the images the process-local cache still holds as recently scanned
 
-        except Exception as e:
-            logging.warning(f'Error checking recent scans: {str(e)}')
-            return False
+        Args:
+            images: Image names
+
+        Returns:
+            Set of image names with unexpired cache entries
+        """
+        now = time.monotonic()
+        hits = set()
+        with self._recent_lock:
+            for image in images:
+                expires = self._recent_cache.get(image)
+                if expires is None:
+                    continue
+                if expires > now:
+                    self._recent_cache.move_to_end(image)
+                    hits.add(image)
+                else:
+                    del self._recent_cache[image]
+        return hits
+
+    def _remember_recent(self, images):
+        """
+        Record images as recently scanned in the process-local cache for recent_cache_ttl seconds
+
+        Args:
+            images: Image names
+        """
+        expires = time.monotonic() + self.recent_cache_ttl
+        with self._recent_lock:
+            for image in images:
+                self._recent_cache[image] = expires
+                self._recent_cache.move_to_end(image)
+            # Evict least recently used entries beyond the size bound
+            while len(self._recent_cache) > self.recent_cache_size:
+                self._recent_cache.popitem(last=False)
 
     def _sanitize_name(self, name: str) -> str:
         """
@@ -182,8 +443,8 @@ class StorageHandler:
         Returns:
             Sanitized name
         """
-        # Replace special characters with underscores
-        sanitized = name.replace('/', '_').replace(':', '_').replace('@', '_')
-        # Remove any remaining invalid characters
-        sanitized = ''.join(c if c.isalnum() or c in '-_.' else '_' for c in sanitized)
-        return sanitized
+        # Image names are ASCII in practice: one C-level translate replaces every invalid character
+        if name.isascii():
+            return name.translate(_SANITIZE_TABLE)
+        # Replace any other invalid characters (including / : @) with underscores
+        return ''.join(c if c.isalnum() or c in '-_.' else '_' for c in name)